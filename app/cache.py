@@ -0,0 +1,40 @@
+# app/cache.py
+import threading
+import time
+
+
+class TTLCache:
+	"""Small in-process cache whose entries expire `ttl` seconds after being set."""
+
+	def __init__(self, ttl: float, maxsize: int = 512):
+		self.ttl = ttl
+		self.maxsize = maxsize
+		self._data = {}
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None):
+		with self._lock:
+			item = self._data.get(key)
+			if item is None:
+				return default
+			value, expires_at = item
+			if expires_at < time.monotonic():
+				del self._data[key]
+				return default
+			return value
+
+	def set(self, key, value):
+		with self._lock:
+			if key not in self._data and len(self._data) >= self.maxsize:
+				# Evict the oldest insertion to stay bounded
+				del self._data[next(iter(self._data))]
+			self._data[key] = (value, time.monotonic() + self.ttl)
+
+	def pop(self, key, default=None):
+		with self._lock:
+			item = self._data.pop(key, None)
+		return default if item is None else item[0]
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
@@ -1,7 +1,11 @@
 # app/crud.py
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, delete, exists, insert, select, text, update
+from sqlalchemy.orm import Session, joinedload, selectinload
 from app import models                              # 🔽 absolute
 from app.models import GameStatus, LogEntry, RevenueEntry, Location, Game, User, UserRole
+from app.cache import TTLCache
+from collections import namedtuple
+from datetime import datetime
 from typing import Optional
 
 
@@ -13,8 +17,11 @@ def get_user_by_pin(db: Session, pin: str):
 def get_users(db: Session):
 	return db.query(models.User).all()
 
+def has_users(db: Session) -> bool:
+	return db.scalar(select(exists().where(User.id.isnot(None))))
+
 def get_user_by_id(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return db.get(models.User, user_id)
 
 def create_user(db: Session, name: str, pin: str, role: UserRole,
                 email: Optional[str] = None,
@@ -26,41 +33,68 @@ def create_user(db: Session, name: str, pin: str, role: UserRole,
                    notify=bool(notify))
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
+    _notify_recipients.clear()
     return db_user
 
-def update_user(db: Session, user: User, name: str, pin: Optional[str], role: UserRole,
+def update_user(db: Session, user_id: int, name: str, pin: Optional[str], role: UserRole,
                 email: Optional[str] = None,
                 phone: Optional[str] = None,
-                notify: Optional[bool] = None):
-    user.name = name
-    user.role = role
+                notify: Optional[bool] = None) -> bool:
+    """Updates a user with a single UPDATE (no SELECT first); False if no such user."""
+    values = {"name": name, "role": role, "email": (email or None), "phone": (phone or None)}
     if pin:
-        user.pin = pin
-    user.email = (email or None)
-    user.phone = (phone or None)
+        values["pin"] = pin
     if notify is not None:
-        user.notify = bool(notify)
+        values["notify"] = bool(notify)
+    updated = db.execute(update(User).where(User.id == user_id).values(**values)).rowcount
     db.commit()
-    db.refresh(user)
-    return user
-
-def get_users_to_notify(db: Session):
-    return (db.query(User)
-              .filter(User.notify == True, User.email.isnot(None))  # noqa: E712
-              .all())
+    _notify_recipients.clear()
+    return updated > 0
+
+# Fault subscribers as (id, name, email); cleared by the user helpers below whenever users change
+_notify_recipients = TTLCache(ttl=60, maxsize=1)
+
+def get_users_to_notify(db: Session, exclude_user_id: Optional[int] = None):
+    """(name, email) rows for users subscribed to fault emails, optionally leaving one user out."""
+    recipients = _notify_recipients.get("all")
+    if recipients is None:
+        rows = db.execute(select(User.id, User.name, User.email).where(
+            User.notify == True, User.email.isnot(None), User.email != ""  # noqa: E712
+        ))
+        recipients = tuple(tuple(row) for row in rows)
+        _notify_recipients.set("all", recipients)
+    return [(name, email) for user_id, name, email in recipients if user_id != exclude_user_id]
 
 def delete_user(db: Session, user_to_delete: User):
     db.delete(user_to_delete)
     db.commit()
+    _notify_recipients.clear()
 
 # ----------- LOCATIONS -----------
 
 def get_locations(db: Session):
     return db.query(models.Location).order_by(models.Location.name).all()
 
+# Dropdowns and lists only need (id, name); locations rarely change, so keep them briefly
+LocationChoice = namedtuple("LocationChoice", "id name")
+_location_choices = TTLCache(ttl=60, maxsize=1)
+
+def get_location_choices(db: Session):
+    choices = _location_choices.get("all")
+    if choices is None:
+        rows = db.execute(select(models.Location.id, models.Location.name).order_by(models.Location.name))
+        choices = tuple(LocationChoice(*row) for row in rows)
+        _location_choices.set("all", choices)
+    return choices
+
+def invalidate_location_choices():
+    _location_choices.clear()
+
+def get_default_location_id(db: Session):
+    return db.execute(select(models.Location.id).order_by(models.Location.name).limit(1)).scalar()
+
 def get_location_by_id(db: Session, location_id: int):
-	return db.query(models.Location).filter(models.Location.id == location_id).first()
+	return db.get(models.Location, location_id)
 
 def create_location(db: Session, name: str, rows: int, columns: int, cell_size: int, token_value: float):
 	db_location = Location(
@@ -72,12 +106,17 @@ def create_location(db: Session, name: str, rows: int, columns: int, cell_size:
 	)
 	db.add(db_location)
 	db.commit()
-	db.refresh(db_location)
+	invalidate_location_choices()
 	return db_location
 
+def location_has_games(db: Session, location_id: int) -> bool:
+	return db.scalar(select(exists().where(Game.location_id == location_id)))
+
 def delete_location(db: Session, location: Location):
-	db.delete(location)
+	# Callers check location_has_games first; a bulk DELETE skips the ORM loading games to unlink them
+	db.execute(delete(Location).where(Location.id == location.id))
 	db.commit()
+	invalidate_location_choices()
 
 
 # ----------- CATEGORIES -----------
@@ -86,37 +125,71 @@ def delete_location(db: Session, location: Location):
 def get_categories(db: Session):
     return db.query(models.Category).order_by(models.Category.name).all()
 
+# Game forms only need (id, name) for the category picker; same short-lived cache as locations
+CategoryChoice = namedtuple("CategoryChoice", "id name")
+_category_choices = TTLCache(ttl=60, maxsize=1)
+
+def get_category_choices(db: Session):
+    choices = _category_choices.get("all")
+    if choices is None:
+        rows = db.execute(select(models.Category.id, models.Category.name).order_by(models.Category.name))
+        choices = tuple(CategoryChoice(*row) for row in rows)
+        _category_choices.set("all", choices)
+    return choices
+
+def invalidate_category_choices():
+    _category_choices.clear()
+
 def get_category_by_id(db: Session, category_id: int):
-    return db.query(models.Category).filter(models.Category.id == category_id).first()
+    return db.get(models.Category, category_id)
+
+def category_name_exists(db: Session, name: str, exclude_id: int | None = None) -> bool:
+    clause = exists().where(models.Category.name == name)
+    if exclude_id is not None:
+        clause = clause.where(models.Category.id != exclude_id)
+    return db.scalar(select(clause))
 
-def get_category_by_name(db: Session, name: str):
-    return db.query(models.Category).filter(models.Category.name == name).first()
+def category_has_games(db: Session, category_id: int) -> bool:
+    return db.scalar(select(exists().where(Game.category_id == category_id)))
 
 def create_category(db: Session, name: str, icon: str | None = None):
     cat = models.Category(name=name.strip(), icon=icon or None)
     db.add(cat)
     db.commit()
-    db.refresh(cat)
+    invalidate_category_choices()
     return cat
 
 def update_category(db: Session, category: models.Category, name: str, icon: str | None = None):
     category.name = name.strip()
     category.icon = icon or None
     db.commit()
-    db.refresh(category)
+    invalidate_category_choices()
     return category
 
 def delete_category(db: Session, category: models.Category):
-    db.delete(category)
+    # Callers check category_has_games first, so there are no games to unlink
+    db.execute(delete(models.Category).where(models.Category.id == category.id))
     db.commit()
+    invalidate_category_choices()
 
 # ----------- GAMES -----------
 
-def get_games_by_location(db: Session, location_id: int):
-    return db.query(models.Game).filter(models.Game.location_id == location_id).all()
+# Grid tiles only render these columns; contact details stay unloaded. Built once so
+# every request hits the same compiled-statement cache entry.
+_LOCATION_WITH_GAMES = (
+    select(models.Location)
+    .options(joinedload(models.Location.games).load_only(
+        models.Game.id, models.Game.name, models.Game.status,
+        models.Game.x, models.Game.y, models.Game.icon))
+    .where(models.Location.id == bindparam("location_id"))
+)
+
+def get_location_with_games(db: Session, location_id: int):
+    """The location with its grid tiles loaded, in one joined SELECT."""
+    return db.scalars(_LOCATION_WITH_GAMES, {"location_id": location_id}).unique().first()
 
 def get_game_by_id(db: Session, game_id: int):
-    return db.query(models.Game).filter(models.Game.id == game_id).first()
+    return db.get(models.Game, game_id)
 
 def get_game_at(db: Session, location_id: int, x: int, y: int):
     return (db.query(models.Game)
@@ -125,27 +198,39 @@ def get_game_at(db: Session, location_id: int, x: int, y: int):
                       models.Game.y == y)
               .first())
 
-def update_game_position(db: Session, game: models.Game, x: int, y: int):
+def update_game_position(db: Session, game: models.Game, x: int, y: int, commit: bool = True):
     game.x = x
     game.y = y
-    db.commit()
-    db.refresh(game)
+    if commit:
+        db.commit()
     return game
 
-def swap_game_positions(db: Session, game_a: models.Game, game_b: models.Game):
+def swap_game_positions(db: Session, game_a: models.Game, game_b: models.Game, commit: bool = True):
     ax, ay = game_a.x, game_a.y
     bx, by = game_b.x, game_b.y
     game_a.x, game_a.y = bx, by
     game_b.x, game_b.y = ax, ay
-    db.commit()
-    db.refresh(game_a)
-    db.refresh(game_b)
+    if commit:
+        db.commit()
     return game_a, game_b
 
+def swap_many_game_positions(db: Session, pairs):
+    """Swaps each (game_a, game_b) pair and commits once for the whole batch."""
+    for game_a, game_b in pairs:
+        swap_game_positions(db, game_a, game_b, commit=False)
+    db.commit()
+
+def get_game_choices(db: Session):
+    """(id, name) rows for every game, for pickers that don't need full Game objects."""
+    return db.execute(select(models.Game.id, models.Game.name).order_by(models.Game.name)).all()
+
 def get_all_games(db: Session):
-	return db.query(models.Game).order_by(models.Game.name).all()
+	# The games table shows each game's category and location; load them up front, not per row
+	return db.query(models.Game).options(
+		selectinload(models.Game.category), selectinload(models.Game.location)
+	).order_by(models.Game.name).all()
 
-def create_game(db: Session, name: str, category_id: int, location_id: Optional[int], x: Optional[int], y: Optional[int], poc_name: Optional[str], poc_email: Optional[str], poc_phone: Optional[str], icon: Optional[str]):
+def create_game(db: Session, name: str, category_id: int, location_id: Optional[int], x: Optional[int], y: Optional[int], poc_name: Optional[str] = None, poc_email: Optional[str] = None, poc_phone: Optional[str] = None, icon: Optional[str] = None):
     db_game = Game(
         name=name,
         category_id=category_id,
@@ -160,78 +245,57 @@ def create_game(db: Session, name: str, category_id: int, location_id: Optional[
     )
     db.add(db_game)
     db.commit()
-    db.refresh(db_game)
     return db_game
 
-def update_game(db: Session, game: models.Game, name: str, category_id: int, location_id: Optional[int], x: Optional[int], y: Optional[int], poc_name: Optional[str], poc_email: Optional[str], poc_phone: Optional[str], icon: Optional[str]):
-    game.name = name
-    game.category_id = category_id
-    game.location_id = location_id
-    game.x = x
-    game.y = y
-    game.poc_name = poc_name
-    game.poc_email = poc_email
-    game.poc_phone = poc_phone
-    game.icon = icon
+def update_game(db: Session, game_id: int, **values) -> bool:
+    """Updates the given Game columns with a single UPDATE (no SELECT first); False if no such game."""
+    updated = db.execute(update(Game).where(Game.id == game_id).values(**values)).rowcount
     db.commit()
-    db.refresh(game)
-    return game
+    return updated > 0
 
 def delete_game(db: Session, game: models.Game):
-    db.delete(game)
+    """Deletes a game together with its status and revenue history in one transaction."""
+    # Bulk DELETEs: nothing is loaded just to be unlinked, and there is a single commit
+    db.execute(delete(LogEntry).where(LogEntry.game_id == game.id))
+    db.execute(delete(RevenueEntry).where(RevenueEntry.game_id == game.id))
+    db.execute(delete(Game).where(Game.id == game.id))
     db.commit()
 
-def update_game_status(db: Session, game: models.Game, status: GameStatus, user_id: int, comment: str = ""):
-	game.status = status
-	log = LogEntry(
-		game_id=game.id,
+def apply_status_change(db: Session, game_id: int, status: GameStatus, user_id: int, comment: str = "", commit: bool = True):
+	"""Sets a game's status and logs it with one UPDATE and one INSERT, no reload of the game."""
+	# ORM-enabled update also syncs any Game instance already in the session
+	db.execute(update(Game).where(Game.id == game_id).values(status=status))
+	db.execute(insert(LogEntry).values(
+		game_id=game_id,
 		user_id=user_id,
 		action=status.value,
 		comments=comment
-	)
-	db.add(log)
-	db.commit()
-	db.refresh(game)
+	))
+	if commit:
+		db.commit()
+
+def update_game_status(db: Session, game: models.Game, status: GameStatus, user_id: int, comment: str = "", commit: bool = True):
+	apply_status_change(db, game.id, status, user_id, comment, commit=commit)
 	return game
 
-def report_fault(db: Session, game: models.Game, user_id: int, comment: str, status: GameStatus):
-	log = LogEntry(
-		game_id=game.id,
-		user_id=user_id,
-		action=status.value,
-		comments=comment
-	)
-	game.status = status
-	db.add(log)
-	db.commit()
-	db.refresh(game)
+def report_fault(db: Session, game: models.Game, user_id: int, comment: str, status: GameStatus, commit: bool = True):
+	apply_status_change(db, game.id, status, user_id, comment, commit=commit)
 	return game
 
-def report_fix(db: Session, game: models.Game, user_id: int, comment: str = ""):
-	log = LogEntry(
-		game_id=game.id,
-		user_id=user_id,
-		action="working",
-		comments=comment
-	)
-	game.status = GameStatus.working
-	db.add(log)
-	db.commit()
-	db.refresh(game)
+def report_fix(db: Session, game: models.Game, user_id: int, comment: str = "", commit: bool = True):
+	apply_status_change(db, game.id, GameStatus.working, user_id, comment, commit=commit)
 	return game
 
 # ----------- REVENUE -----------
 
-from typing import Optional
-from datetime import datetime
-
 def log_revenue(
     db: Session,
     game: models.Game,
     user_id: int,
     amount: float,
     is_token: bool,
-    collected_at: Optional[datetime] = None
+    collected_at: Optional[datetime] = None,
+    commit: bool = True
 ):
     entry = RevenueEntry(
         game_id=game.id,
@@ -243,26 +307,41 @@ def log_revenue(
         entry.timestamp = collected_at  # override server_default now
 
     db.add(entry)
-    db.commit()
+    if commit:
+        db.commit()
     return entry
 
+def log_revenue_bulk(db: Session, rows: list[dict]):
+    """Inserts many revenue entries (game_id, user_id, amount, is_token[, timestamp]) in one executemany."""
+    if rows:
+        db.execute(insert(RevenueEntry), rows)
+        db.commit()
+
 # --- History Deletion ---
 
 def clear_all_log_entries(db: Session):
-    db.query(LogEntry).delete()
+    db.query(LogEntry).delete(synchronize_session=False)
     db.commit()
 
 def clear_all_revenue_entries(db: Session):
-    db.query(RevenueEntry).delete()
+    db.query(RevenueEntry).delete(synchronize_session=False)
+    db.commit()
+
+def clear_all_history(db: Session):
+    """Wipes status and revenue history for every game in a single commit."""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(
+            f"TRUNCATE {LogEntry.__tablename__}, {RevenueEntry.__tablename__} RESTART IDENTITY"
+        ))
+    else:
+        db.query(LogEntry).delete(synchronize_session=False)
+        db.query(RevenueEntry).delete(synchronize_session=False)
     db.commit()
 
-# crud.py
 def clear_status_history_for_game(db: Session, game_id: int):
-    # Replace models.StatusEntry with your actual status-history model/table
-    db.query(models.StatusEntry).filter(models.StatusEntry.game_id == game_id).delete(synchronize_session=False)
+    db.query(models.LogEntry).filter(models.LogEntry.game_id == game_id).delete(synchronize_session=False)
     db.commit()
 
 def clear_revenue_history_for_game(db: Session, game_id: int):
-    # If your table is revenue_entries, update accordingly
     db.query(models.RevenueEntry).filter(models.RevenueEntry.game_id == game_id).delete(synchronize_session=False)
     db.commit()
@@ -1,23 +1,63 @@
 # app/database.py
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
 # Define DB path (inside container or local env)
 DB_PATH = os.getenv("DATABASE_URL", "sqlite:///./barcade.db")
+IS_SQLITE = DB_PATH.startswith("sqlite")
+# In-memory SQLite gets SingletonThreadPool, which rejects QueuePool sizing arguments
+IS_MEMORY_SQLITE = IS_SQLITE and make_url(DB_PATH).database in (None, "", ":memory:")
+pool_kwargs = {} if IS_MEMORY_SQLITE else {"pool_size": 10, "max_overflow": 20, "pool_timeout": 30}
 
 # For SQLite, check_same_thread must be False when using multithreaded apps like FastAPI
-engine = create_engine(DB_PATH, connect_args={"check_same_thread": False})
+engine = create_engine(
+	DB_PATH,
+	connect_args={"check_same_thread": False} if IS_SQLITE else {},
+	pool_recycle=3600,
+	pool_pre_ping=True,
+	query_cache_size=1200,
+	insertmanyvalues_page_size=1000,
+	**pool_kwargs,
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if IS_SQLITE:
+	@event.listens_for(engine, "connect")
+	def _set_sqlite_pragmas(dbapi_connection, connection_record):
+		# WAL lets readers proceed while a request is writing; NORMAL sync is safe under WAL.
+		cursor = dbapi_connection.cursor()
+		cursor.execute("PRAGMA journal_mode=WAL")
+		cursor.execute("PRAGMA synchronous=NORMAL")
+		cursor.execute("PRAGMA temp_store=MEMORY")
+		cursor.execute("PRAGMA mmap_size=268435456")
+		cursor.close()
+
+# Objects stay usable after commit, so CRUD helpers don't re-SELECT rows they just wrote
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
 
 Base = declarative_base()
 
-# Dependency for route functions
+# Dependency for route functions; the session only checks out a connection on first query
 def get_db():
 	db = SessionLocal()
 	try:
 		yield db
 	finally:
 		db.close()
+
+@contextmanager
+def count_queries(bind=engine):
+	"""Collects every SQL statement sent through `bind` while the block runs (N+1 checks)."""
+	statements = []
+
+	def _record(conn, cursor, statement, parameters, context, executemany):
+		statements.append(statement)
+
+	event.listen(bind, "before_cursor_execute", _record)
+	try:
+		yield statements
+	finally:
+		event.remove(bind, "before_cursor_execute", _record)
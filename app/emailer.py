@@ -11,14 +11,16 @@ SMTP_PASS = os.getenv("SMTP_PASSWORD")
 SMTP_FROM = os.getenv("SMTP_FROM")
 SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
 
+# Settings are read once at import, so validate them once too
+_MISSING_SETTINGS = [k for k,v in {
+	"SMTP_HOST": SMTP_HOST, "SMTP_USER": SMTP_USER,
+	"SMTP_PASS": SMTP_PASS, "SMTP_FROM": SMTP_FROM
+}.items() if not v]
+EMAIL_ENABLED = not _MISSING_SETTINGS
+
 def send_email(to_addr: str, subject: str, body: str) -> bool:
-	# Basic validation
-	missing = [k for k,v in {
-		"SMTP_HOST": SMTP_HOST, "SMTP_USER": SMTP_USER,
-		"SMTP_PASS": SMTP_PASS, "SMTP_FROM": SMTP_FROM
-	}.items() if not v]
-	if missing:
-		log.warning("Email disabled; missing env: %s", ", ".join(missing))
+	if not EMAIL_ENABLED:
+		log.warning("Email disabled; missing env: %s", ", ".join(_MISSING_SETTINGS))
 		return False
 
 	try:
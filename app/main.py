@@ -2,29 +2,41 @@
 
 # --- Imports ---
 import os
+import hashlib
 import json
-import shutil
+import logging
 import smtplib
+import tempfile
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from email.message import EmailMessage
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
+import anyio.to_thread
 from fastapi import (BackgroundTasks, Depends, FastAPI, File, Form,
                    HTTPException, Request, UploadFile)
-from fastapi.responses import (HTMLResponse, JSONResponse, RedirectResponse,
-                               Response)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import (HTMLResponse, JSONResponse, ORJSONResponse,
+                               RedirectResponse, Response)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from starlette.middleware.sessions import SessionMiddleware
-
-from app import crud, database, models
-from app.database import SessionLocal, engine
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+import orjson
+from pydantic import BaseModel, ValidationError, field_validator
+from sqlalchemy import case, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from app import crud, database, models, responses
+from app.database import engine, get_db
+from app.middleware import QueryCountMiddleware, SessionASGIMiddleware
 from app.models import Base
 from app.utils import install_template_filters
 
+log = logging.getLogger(__name__)
+
 
 # --- Pydantic Models ---
 class LocationUpdateForm(BaseModel):
@@ -34,41 +46,145 @@ class LocationUpdateForm(BaseModel):
     cell_size: int
     token_value: float
 
-
-# --- Database Initialization ---
-Base.metadata.create_all(bind=engine)
+class GameForm(BaseModel):
+    name: str
+    category_id: int
+    location_id: Optional[int] = None
+    x: Optional[int] = None
+    y: Optional[int] = None
+    poc_name: Optional[str] = None
+    poc_email: Optional[str] = None
+    poc_phone: Optional[str] = None
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _blank_to_none(cls, value):
+        # Empty inputs are submitted as "", which means "not set"
+        return None if value == "" else value
+
+
+# --- Startup ---
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+# Mail settings don't change while the process runs; read them once
+SMTP_HOST = os.getenv("SMTP_HOST", "").strip()
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_FROM = os.getenv("SMTP_FROM", SMTP_USERNAME or "no-reply@example.com")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
+NOTIFY_ON_FAULTS = os.getenv("EMAIL_NOTIFY_ON_FAULTS", "true").lower() in ("1", "true", "yes")
+FAULT_STATUSES = frozenset((models.GameStatus.needs_maintenance, models.GameStatus.out_of_order))
+# Everything after the greeting is the same for every recipient of one fault
+FAULT_EMAIL_BODY = (
+    "The game '{game}' was marked '{status}' by {actor}.\n\n"
+    "Note: {comment}\n\n— You received this email because your user is subscribed to game fault updates."
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """One-time process setup: schema, worker thread limit, template globals and template warm-up."""
+    Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add indexes declared since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except IntegrityError:
+                # A unique index over rows that already clash (e.g. two users sharing a PIN)
+                log.warning("Could not create unique index %s; fix the duplicate rows and restart", index.name)
+
+    # Sync handlers run in anyio's worker threads; size that pool to the DB pool (10 + 20 overflow) plus headroom
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    templates.env.globals["has_logo"] = Path("app/static/images/logo.png").exists()
+    # Compile every template up front (filling the bytecode cache) instead of on first request
+    for template_name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(template_name)
+    yield
 
 
 # --- FastAPI App Setup ---
-app = FastAPI()
-app.add_middleware(SessionMiddleware, secret_key="barcade-secret")
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(SessionASGIMiddleware, secret_key="barcade-secret")
+if os.getenv("LOG_QUERY_COUNTS", "false").lower() in ("1", "true", "yes"):
+    app.add_middleware(QueryCountMiddleware)
 
 # Mount static files and configure Jinja2 templates
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
-templates.env.globals["has_logo"] = Path("app/static/images/logo.png").exists()
+# Compiled templates are cached on disk; only re-stat sources when auto-reload is on (dev)
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader("app/templates"),
+    autoescape=True,
+    auto_reload=os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() in ("1", "true", "yes"),
+    bytecode_cache=FileSystemBytecodeCache(),
+))
 templates.env.globals["datetime"] = datetime
 install_template_filters(templates)
 
 
-# --- Dependencies ---
-def get_db():
-    """Dependency to get a database session for a request."""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # --- Helper Functions ---
 
-def get_current_user(request: Request, db: Session):
-    """Retrieves the current logged-in user from the session."""
-    pin = request.session.get("pin")
-    if pin:
-        return crud.get_user_by_pin(db, pin)
-    return None
+def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optional[models.User]:
+    """Retrieves the current logged-in user from the session (looked up once per request)."""
+    if hasattr(request.state, "user"):
+        return request.state.user
+    # Primary-key lookup (identity map first) rather than searching users by PIN
+    user_id = request.session.get("user_id")
+    user = crud.get_user_by_id(db, int(user_id)) if user_id else None
+    # Changing a user's PIN still ends their existing sessions
+    if user is not None and user.pin != request.session.get("pin"):
+        user = None
+    request.state.user = user
+    return user
+
+def hx_trigger(events: dict) -> str:
+    """Serializes events for the HX-Trigger response header."""
+    payload = orjson.dumps(events)
+    # Headers are latin-1; orjson emits raw UTF-8, so non-ASCII text needs json's \u escapes
+    return payload.decode() if payload.isascii() else json.dumps(events)
+
+@lru_cache(maxsize=None)
+def _render_static(template_name: str, **context) -> str:
+    return templates.get_template(template_name).render(**context)
+
+def static_page(template_name: str, **context) -> HTMLResponse:
+    """Serves a template with no per-request data, rendered once per process (every time when auto-reloading)."""
+    if templates.env.auto_reload:
+        _render_static.cache_clear()
+    return HTMLResponse(_render_static(template_name, **context))
+
+async def game_form(request: Request) -> GameForm:
+    """Dependency that validates the game add/edit form fields in one pass."""
+    try:
+        return GameForm.model_validate(dict(await request.form()))
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors())
+
+def require_admin(user: Optional[models.User] = Depends(get_current_user)) -> models.User:
+    """Dependency that returns the logged-in admin or rejects the request with 403."""
+    if not user or user.role != models.UserRole.admin:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return user
+
+def _save_upload(upload: UploadFile) -> str:
+    """Stores an uploaded image in app/static/images under its content hash and returns the filename."""
+    images_dir = Path("app/static/images")
+    images_dir.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=images_dir, delete=False) as tmp:
+        while chunk := upload.file.read(1 << 20):
+            digest.update(chunk)
+            tmp.write(chunk)
+    filename = f"{digest.hexdigest()[:16]}{Path(upload.filename).suffix.lower()}"
+    target = images_dir / filename
+    if target.exists():
+        # Same bytes were uploaded before; keep the existing file
+        os.unlink(tmp.name)
+    else:
+        os.chmod(tmp.name, 0o644)
+        os.replace(tmp.name, target)
+    return filename
 
 def get_selected_location(request: Request):
     """Retrieves the selected location ID from the session."""
@@ -79,69 +195,72 @@ def require_logged_in(request: Request):
     if not request.session.get("logged_in"):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-def _send_email(to_addr: str, subject: str, body: str):
-    """Sends an email using SMTP settings from environment variables."""
-    host = os.getenv("SMTP_HOST")
-    port = int(os.getenv("SMTP_PORT", "587"))
-    user = os.getenv("SMTP_USERNAME")
-    pwd = os.getenv("SMTP_PASSWORD")
-    sender = os.getenv("SMTP_FROM", user or "no-reply@example.com")
-    starttls = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
-
-    if not all([host, port, sender]):
+def _send_emails(messages: list):
+    """Sends (to_addr, subject, body) emails over one SMTP connection, using the SMTP_* settings."""
+    if not all([SMTP_HOST, SMTP_PORT, SMTP_FROM]) or not messages:
         return  # Mail not configured, skip silently
 
-    msg = EmailMessage()
-    msg["From"] = sender
-    msg["To"] = to_addr
-    msg["Subject"] = subject
-    msg.set_content(body)
-
-    with smtplib.SMTP(host, port, timeout=10) as s:
-        if starttls:
+    # One connect/STARTTLS/login for the whole batch instead of one per recipient
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as s:
+        if SMTP_STARTTLS:
             s.starttls()
-        if user and pwd:
-            s.login(user, pwd)
-        s.send_message(msg)
+        if SMTP_USERNAME and SMTP_PASSWORD:
+            s.login(SMTP_USERNAME, SMTP_PASSWORD)
+        for to_addr, subject, body in messages:
+            msg = EmailMessage()
+            msg["From"] = SMTP_FROM
+            msg["To"] = to_addr
+            msg["Subject"] = subject
+            msg.set_content(body)
+            try:
+                s.send_message(msg)
+            except smtplib.SMTPRecipientsRefused:
+                continue  # One bad address shouldn't stop the rest of the batch
 
 
 # =============================================================================
 # --- Core UI & Dashboard Routes
 # =============================================================================
 
+# Once any user exists the wizard is never needed again (the last admin can't delete themselves)
+_setup_complete = False
+
 @app.get("/", response_class=HTMLResponse)
-def dashboard(request: Request, db: Session = Depends(get_db)):
+def dashboard(request: Request, db: Session = Depends(get_db), user: Optional[models.User] = Depends(get_current_user)):
     """Renders the main dashboard page, the entry point of the application."""
-    user = get_current_user(request, db)
+    global _setup_complete
     location_id = get_selected_location(request)
 
     # If no users exist, trigger the first-run setup wizard
-    if not crud.get_users(db):
+    if not _setup_complete:
+        _setup_complete = user is not None or crud.has_users(db)
+    if not _setup_complete:
         return templates.TemplateResponse("dashboard.html", {
             "request": request, "user": None, "role": None,
             "locations": [], "selected_location": None, "games": [],
             "first_run": True
         })
 
-    locations = crud.get_locations(db)
     # Default to the first location if none is selected
-    if not location_id and locations:
-        location_id = locations[0].id
-        request.session["location_id"] = location_id
+    if not location_id:
+        location_id = crud.get_default_location_id(db)
+        if location_id is not None:
+            request.session["location_id"] = location_id
 
-    selected_location = crud.get_location_by_id(db, location_id) if location_id else None
-    games = crud.get_games_by_location(db, location_id) if location_id else []
+    # The header's location dropdown is loaded separately via /location-selector
+    selected_location = crud.get_location_with_games(db, location_id) if location_id else None
+    games = selected_location.games if selected_location else []
 
     return templates.TemplateResponse("dashboard.html", {
         "request": request, "user": user,
         "role": user.role.value if user else None,
-        "locations": locations, "selected_location": selected_location, "games": games
+        "selected_location": selected_location, "games": games
     })
 
 @app.get("/location-selector", response_class=HTMLResponse)
 def location_selector(request: Request, db: Session = Depends(get_db)):
     """Renders the location selector dropdown component for the header."""
-    locations = crud.get_locations(db)
+    locations = crud.get_location_choices(db)
     selected_location_id = get_selected_location(request)
     return templates.TemplateResponse("location_selector.html", {
         "request": request, "locations": locations, "selected_location_id": selected_location_id
@@ -150,12 +269,12 @@ def location_selector(request: Request, db: Session = Depends(get_db)):
 @app.get("/grid-fragment", response_class=HTMLResponse)
 def grid_fragment(request: Request, db: Session = Depends(get_db)):
     """Renders just the game grid, used for HTMX partial page updates."""
-    user = get_current_user(request, db)
+    # The grid markup doesn't depend on who is viewing it, so no user lookup here
     location_id = request.session.get("location_id")
-    selected_location = crud.get_location_by_id(db, location_id) if location_id else None
-    games = crud.get_games_by_location(db, location_id) if location_id else []
+    selected_location = crud.get_location_with_games(db, location_id) if location_id else None
+    games = selected_location.games if selected_location else []
     return templates.TemplateResponse("grid_fragment.html", {
-        "request": request, "user": user,
+        "request": request,
         "selected_location": selected_location, "games": games
     })
 
@@ -169,22 +288,24 @@ def login(pin: str = Form(...), request: Request = None, db: Session = Depends(g
     """Handles user login with a PIN and sets session data."""
     user = crud.get_user_by_pin(db, pin)
     if user:
-        request.session["pin"] = pin
-        request.session["user_id"] = str(user.id)
-        request.session["name"] = user.name
-        request.session["role"] = user.role.value
-        request.session["is_manager"] = (user.role == models.UserRole.admin)
-        request.session["logged_in"] = True
+        request.session.update({
+            "pin": pin,
+            "user_id": str(user.id),
+            "name": user.name,
+            "role": user.role.value,
+            "is_manager": user.role == models.UserRole.admin,
+            "logged_in": True,
+        })
     return RedirectResponse(url="/", status_code=303)
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     """Clears the session to log the user out."""
     request.session.clear()
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/select-location")
-def select_location(location_id: int = Form(...), request: Request = None):
+async def select_location(location_id: int = Form(...), request: Request = None):
     """Sets the user's currently selected location in the session."""
     request.session["location_id"] = location_id
     return RedirectResponse(url="/", status_code=303)
@@ -195,9 +316,9 @@ def select_location(location_id: int = Form(...), request: Request = None):
 # =============================================================================
 
 @app.get("/setup/first-run", response_class=HTMLResponse)
-def setup_first_run(request: Request):
+async def setup_first_run(request: Request):
     """Renders the initial step of the setup wizard modal."""
-    return templates.TemplateResponse("setup/first_run_modal.html", {"request": request})
+    return static_page("setup/first_run_modal.html")
 
 @app.post("/setup/first-run/admin", response_class=HTMLResponse)
 def setup_create_admin(
@@ -205,20 +326,22 @@ def setup_create_admin(
     db: Session = Depends(get_db)
 ):
     """Step 1: Creates the first admin user and auto-logs them in."""
-    if crud.get_users(db):
-        return HTMLResponse("Already initialized", status_code=400)
+    if crud.has_users(db):
+        return responses.ALREADY_INITIALIZED
 
     new_user = crud.create_user(db, name=name, pin=pin, role=models.UserRole.admin)
 
     # Automatically log in the new admin to continue the wizard
-    request.session["pin"] = pin
-    request.session["user_id"] = str(new_user.id)
-    request.session["name"] = new_user.name
-    request.session["role"] = new_user.role.value
-    request.session["is_manager"] = True
-    request.session["logged_in"] = True
+    request.session.update({
+        "pin": pin,
+        "user_id": str(new_user.id),
+        "name": new_user.name,
+        "role": new_user.role.value,
+        "is_manager": True,
+        "logged_in": True,
+    })
 
-    return templates.TemplateResponse("setup/step_location.html", {"request": request})
+    return static_page("setup/step_location.html")
 
 @app.post("/setup/first-run/location", response_class=HTMLResponse)
 def setup_create_location(
@@ -228,7 +351,7 @@ def setup_create_location(
 ):
     """Step 2: Creates the first location."""
     crud.create_location(db, name, rows, columns, cell_size, token_value)
-    return templates.TemplateResponse("setup/step_category.html", {"request": request})
+    return static_page("setup/step_category.html")
 
 @app.post("/setup/first-run/category", response_class=HTMLResponse)
 def setup_create_category(
@@ -239,8 +362,8 @@ def setup_create_category(
     crud.create_category(db, name, icon)
     return templates.TemplateResponse("setup/step_game.html", {
         "request": request,
-        "categories": crud.get_categories(db),
-        "locations": crud.get_locations(db)
+        "categories": crud.get_category_choices(db),
+        "locations": crud.get_location_choices(db)
     })
 
 @app.post("/setup/first-run/game", response_class=Response)
@@ -259,7 +382,7 @@ def setup_create_game(
 
     resp = Response(status_code=204)  # No content
     resp.headers["HX-Redirect"] = "/"  # Tell HTMX to do a full-page redirect
-    resp.headers["HX-Trigger"] = json.dumps({"close_modal": True})
+    resp.headers["HX-Trigger"] = hx_trigger({"close_modal": True})
     return resp
 
 
@@ -268,12 +391,12 @@ def setup_create_game(
 # =============================================================================
 
 @app.get("/game/{game_id}/modal", response_class=HTMLResponse)
-def game_modal(game_id: int, request: Request, db: Session = Depends(get_db)):
+def game_modal(game_id: int, request: Request, db: Session = Depends(get_db), user: Optional[models.User] = Depends(get_current_user)):
     """Renders the content for a game's detail modal."""
-    user = get_current_user(request, db)
     if not user:
-        return HTMLResponse("Unauthorized", status_code=401)
-    game = crud.get_game_by_id(db, game_id)
+        return responses.NOT_LOGGED_IN
+    # The modal shows the category name; load it with the game
+    game = db.get(models.Game, game_id, options=[joinedload(models.Game.category)])
     return templates.TemplateResponse("game_modal.html", {
         "request": request, "user": user, "game": game
     })
@@ -286,7 +409,8 @@ def move_game(
 ):
     """Moves a game to a new (x, y) coordinate, swapping if the cell is occupied."""
     require_logged_in(request)
-    game = crud.get_game_by_id(db, game_id)
+    # The bounds check needs the game's location; load both in one query
+    game = db.get(models.Game, game_id, options=[joinedload(models.Game.location)])
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
 
@@ -294,7 +418,7 @@ def move_game(
     if game.location_id != selected_location_id:
         raise HTTPException(status_code=400, detail="Game not in selected location")
 
-    location = crud.get_location_by_id(db, selected_location_id)
+    location = game.location
     if not location or not (1 <= x <= location.columns and 1 <= y <= location.rows):
         raise HTTPException(status_code=422, detail="Target out of bounds")
 
@@ -314,11 +438,10 @@ def move_game(
         return JSONResponse({"moved": {"id": game.id, "x": x, "y": y}})
 
 @app.get("/game/{game_id}/status-change-prompt", response_class=HTMLResponse)
-def status_change_prompt(game_id: int, status: str, request: Request, db: Session = Depends(get_db)):
+def status_change_prompt(game_id: int, status: str, request: Request, db: Session = Depends(get_db), user: Optional[models.User] = Depends(get_current_user)):
     """Renders a modal for adding a note when changing a game's status."""
-    user = get_current_user(request, db)
     if not user:
-        return HTMLResponse("Unauthorized", status_code=401)
+        return responses.NOT_LOGGED_IN
 
     game = crud.get_game_by_id(db, game_id)
     submit_url = f"/game/{game.id}/report-fix" if status == 'working' else f"/game/{game.id}/report-fault"
@@ -331,61 +454,48 @@ def status_change_prompt(game_id: int, status: str, request: Request, db: Sessio
 
 @app.post("/game/{game_id}/report-fault")
 def report_fault(
-    request: Request, game_id: int,
+    request: Request, game_id: int, background_tasks: BackgroundTasks,
     status: str = Form(...), note: Optional[str] = Form(""),
-    db: Session = Depends(get_db), background_tasks: BackgroundTasks = BackgroundTasks()
+    db: Session = Depends(get_db),
+    user: Optional[models.User] = Depends(get_current_user)
 ):
     """Records a fault for a game and sends email notifications if configured."""
     game = crud.get_game_by_id(db, game_id)
-    user = get_current_user(request, db)
     if not (game and user):
-        return Response(headers={"HX-Trigger": json.dumps({"close_modal": True})})
+        return responses.CLOSE_MODAL
 
     new_status = models.GameStatus(status)
-    comment = note or f"{new_status.value.replace('_', ' ').title()} reported"
+    status_text = new_status.value.replace('_', ' ')
+    comment = note or f"{status_text.title()} reported"
     crud.report_fault(db, game=game, user_id=user.id, comment=comment, status=new_status)
 
     # Send email notifications for critical faults
-    notify_enabled = os.getenv("EMAIL_NOTIFY_ON_FAULTS", "true").lower() in ("1", "true", "yes")
-    smtp_host = os.getenv("SMTP_HOST", "").strip()
-    fault_statuses = (models.GameStatus.needs_maintenance, models.GameStatus.out_of_order)
-
-    if notify_enabled and smtp_host and new_status in fault_statuses:
-        recipients = db.query(models.User).filter(
-            models.User.notify == True, models.User.email.isnot(None), models.User.email != ""
-        ).all()
-        subject = f"[Barcade App] {game.name} marked {new_status.value.replace('_', ' ')}"
-        body_tmpl = (
-            "Hi {name},\n\nThe game '{game}' was marked '{status}' by {actor}.\n\n"
-            "Note: {comment}\n\n— You received this email because your user is subscribed to game fault updates."
-        )
-        for u in recipients:
-            if u.id != user.id and u.email:
-                background_tasks.add_task(
-                    _send_email, to_addr=u.email.strip(), subject=subject,
-                    body=body_tmpl.format(
-                        name=u.name, game=game.name, status=new_status.value.replace('_', ' '),
-                        actor=user.name, comment=comment or "-"
-                    )
-                )
+    if NOTIFY_ON_FAULTS and SMTP_HOST and new_status in FAULT_STATUSES:
+        # (name, email) pairs from the cached recipient list; the reporting user is filtered out in Python
+        recipients = crud.get_users_to_notify(db, exclude_user_id=user.id)
+        subject = f"[Barcade App] {game.name} marked {status_text}"
+        body = FAULT_EMAIL_BODY.format(game=game.name, status=status_text, actor=user.name, comment=comment or "-")
+        messages = [(email.strip(), subject, f"Hi {name},\n\n{body}") for name, email in recipients]
+        if messages:
+            background_tasks.add_task(_send_emails, messages)
 
     triggers = {
-        "status_changed": {"message": f"'{game.name}' marked {new_status.value.replace('_', ' ')}.",
+        "status_changed": {"message": f"'{game.name}' marked {status_text}.",
                            "id": game.id, "status": new_status.value},
         "refresh_grid": True, "close_modal": True
     }
-    return Response(status_code=204, headers={"HX-Trigger": json.dumps(triggers)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(triggers)})
 
 @app.post("/game/{game_id}/report-fix")
 def report_fix(
     request: Request, game_id: int, note: Optional[str] = Form(""),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    user: Optional[models.User] = Depends(get_current_user)
 ):
     """Records that a game has been fixed and is now 'working'."""
     game = crud.get_game_by_id(db, game_id)
-    user = get_current_user(request, db)
     if not (game and user):
-        return Response(headers={"HX-Trigger": json.dumps({"close_modal": True})})
+        return responses.CLOSE_MODAL
 
     comment = note or "Marked as working"
     crud.report_fix(db, game=game, user_id=user.id, comment=comment)
@@ -394,39 +504,41 @@ def report_fix(
         "status_changed": {"message": f"'{game.name}' marked working."},
         "refresh_grid": True, "close_modal": True
     }
-    return Response(status_code=204, headers={"HX-Trigger": json.dumps(triggers)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(triggers)})
+
+@lru_cache(maxsize=1024)
+def _parse_collected_at(value: str) -> Optional[datetime]:
+    """Parses the form's collection time as UTC; None (meaning "now") if it isn't a valid ISO date."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
 
 @app.post("/game/{game_id}/log-revenue")
 def log_revenue(
     request: Request, game_id: int,
     amount: float = Form(...), is_token: bool = Form(...),
     collected_at: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    user: Optional[models.User] = Depends(get_current_user)
 ):
     """Logs a revenue collection entry for a game."""
-    user = get_current_user(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    game = crud.get_game_by_id(db, game_id)
+    game = db.get(models.Game, game_id, options=[joinedload(models.Game.category)])
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
 
-    try:
-        parsed_ts = datetime.fromisoformat(collected_at) if collected_at else None
-        if parsed_ts and not parsed_ts.tzinfo:
-            parsed_ts = parsed_ts.replace(tzinfo=timezone.utc)
-    except Exception:
-        parsed_ts = None  # Fall back to "now" in CRUD if parsing fails
-
     crud.log_revenue(
         db=db, game=game, user_id=user.id, amount=amount,
-        is_token=is_token, collected_at=parsed_ts
+        is_token=is_token, collected_at=_parse_collected_at(collected_at) if collected_at else None
     )
 
     resp = templates.TemplateResponse("game_modal.html", {
-        "request": request, "user": user, "game": crud.get_game_by_id(db, game_id)
+        "request": request, "user": user, "game": game
     })
-    resp.headers["HX-Trigger"] = json.dumps({"revenue_logged": {"message": "Revenue logged"}})
+    resp.headers["HX-Trigger"] = hx_trigger({"revenue_logged": {"message": "Revenue logged"}})
     return resp
 
 
@@ -434,47 +546,73 @@ def log_revenue(
 # --- Data & History API Routes
 # =============================================================================
 
+DAY_SECONDS = 86400
+
+# The history modals only list the latest entries; the charts use the series endpoints
+RECENT_HISTORY_LIMIT = 15
+
 @app.get("/game/{game_id}/status-history", response_class=HTMLResponse)
 def status_history(request: Request, game_id: int, db: Session = Depends(get_db)):
     """Renders the status history log for a game in a modal."""
     require_logged_in(request)
-    game = db.query(models.Game).filter(models.Game.id == game_id).first()
+    game = crud.get_game_by_id(db, game_id)
     if not game:
-        return HTMLResponse("Game not found.", status_code=404)
+        return responses.GAME_NOT_FOUND
 
-    status_entries = db.query(models.LogEntry).filter(
+    status_entries = db.query(models.LogEntry).options(
+        selectinload(models.LogEntry.user)
+    ).filter(
         models.LogEntry.game_id == game_id
-    ).order_by(models.LogEntry.timestamp.desc()).all()
+    ).order_by(models.LogEntry.timestamp.desc()).limit(RECENT_HISTORY_LIMIT).all()
 
     return templates.TemplateResponse("status_history_modal.html", {
         "request": request, "game": game, "entries": status_entries
     })
 
 @app.get("/game/{game_id}/revenue-history", response_class=HTMLResponse)
-def revenue_history(request: Request, game_id: int, db: Session = Depends(get_db)):
+def revenue_history(request: Request, game_id: int, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     """Renders the revenue history log for a game in a modal (admin only)."""
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        raise HTTPException(status_code=403, detail="Forbidden")
-    game = db.query(models.Game).filter(models.Game.id == game_id).first()
+    game = db.get(models.Game, game_id, options=[joinedload(models.Game.location)])
     if not game:
-        return HTMLResponse("Game not found.", status_code=404)
+        return responses.GAME_NOT_FOUND
 
-    revenue_entries = db.query(models.RevenueEntry).filter(
+    revenue_entries = db.query(models.RevenueEntry).options(
+        selectinload(models.RevenueEntry.user)
+    ).filter(
         models.RevenueEntry.game_id == game_id
-    ).order_by(models.RevenueEntry.timestamp.desc()).all()
+    ).order_by(models.RevenueEntry.timestamp.desc()).limit(RECENT_HISTORY_LIMIT).all()
 
     return templates.TemplateResponse("revenue_history_modal.html", {
         "request": request, "game": game, "entries": revenue_entries
     })
 
-@app.get("/game/{game_id}/status-series")
+def _downtime_by_day(changes, down: bool, start: float, end: float, first_day: float) -> list:
+    """Downtime seconds per day from `first_day` (epoch), given (epoch, is_down) status changes within [start, end]."""
+    downtime = [0.0] * int(-(-(end - first_day) // DAY_SECONDS))
+
+    def spread(seg_start, seg_end):
+        i = int((seg_start - first_day) // DAY_SECONDS)
+        while seg_start < seg_end:
+            day_end = first_day + (i + 1) * DAY_SECONDS
+            downtime[i] += min(seg_end, day_end) - seg_start
+            seg_start, i = day_end, i + 1
+
+    cursor = start
+    for ts, is_down in changes:
+        if down and ts > cursor:
+            spread(cursor, ts)
+        cursor, down = ts, is_down
+    if down and cursor < end:
+        spread(cursor, end)
+    return downtime
+
+@app.get("/game/{game_id}/status-series", response_class=ORJSONResponse)
 def status_series_api(
     game_id: int, start: Optional[str] = None, end: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """API endpoint to get calculated uptime/downtime series data for charts."""
-    game = db.query(models.Game).filter(models.Game.id == game_id).first()
+    game = crud.get_game_by_id(db, game_id)
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
 
@@ -482,57 +620,39 @@ def status_series_api(
     end_dt = datetime.fromisoformat(end).astimezone(timezone.utc) if end else now
     start_dt = datetime.fromisoformat(start).astimezone(timezone.utc) if start else (end_dt - timedelta(days=30))
     if start_dt >= end_dt:
-        return {"daily": [], "totals": {"uptime_hours": 0.0, "downtime_hours": 0.0}}
-
-    logs = db.query(models.LogEntry).filter(
-        models.LogEntry.game_id == game_id
-    ).order_by(models.LogEntry.timestamp.asc()).all()
-
-    # Ensure all timestamps are timezone-aware for accurate calculations
-    for e in logs:
-        if e.timestamp and e.timestamp.tzinfo is None:
-            e.timestamp = e.timestamp.replace(tzinfo=timezone.utc)
-
-    # Find status at the beginning of the time window
-    prev = next((log for log in reversed(logs) if log.timestamp < start_dt), None)
-    current_status = prev.action if prev else "working"
-
-    # Initialize daily buckets for downtime
-    days = {}
-    day_cursor = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    while day_cursor < end_dt:
-        days[day_cursor] = 0.0
-        day_cursor += timedelta(days=1)
-
-    # Walk through time segments defined by log entries to calculate downtime
-    time_cursor = start_dt
-    logs_in_window = [e for e in logs if start_dt <= e.timestamp <= end_dt]
-
-    for entry in logs_in_window:
-        seg_start, seg_end = time_cursor, entry.timestamp
-        if seg_end > seg_start and current_status == "out_of_order":
-            # Distribute this segment's downtime across all affected days
-            d = seg_start.replace(hour=0, minute=0, second=0, microsecond=0)
-            while d < seg_end:
-                day_start = max(seg_start, d)
-                day_end = min(seg_end, d + timedelta(days=1))
-                days[d] += (day_end - day_start).total_seconds()
-                d += timedelta(days=1)
-        time_cursor, current_status = seg_end, entry.action
-
-    # Calculate downtime for the final segment (from last log to end of window)
-    if time_cursor < end_dt and current_status == "out_of_order":
-        d = time_cursor.replace(hour=0, minute=0, second=0, microsecond=0)
-        while d < end_dt:
-            day_start = max(time_cursor, d)
-            day_end = min(end_dt, d + timedelta(days=1))
-            if day_start in days:
-                days[day_start] += (day_end - day_start).total_seconds()
-            d += timedelta(days=1)
+        return ORJSONResponse({"daily": [], "totals": {"uptime_hours": 0.0, "downtime_hours": 0.0}})
+
+    log_ts = models.LogEntry.timestamp
+    # Status at the beginning of the window: the latest change before it
+    prev_action = db.scalar(
+        select(models.LogEntry.action)
+        .where(models.LogEntry.game_id == game_id, log_ts < start_dt)
+        .order_by(log_ts.desc()).limit(1)
+    )
+    current_status = prev_action or "working"
+
+    # Only the changes inside the window; both queries use the (game_id, timestamp) index
+    window = db.execute(
+        select(log_ts, models.LogEntry.action)
+        .where(models.LogEntry.game_id == game_id, log_ts.between(start_dt, end_dt))
+        .order_by(log_ts.asc())
+    ).all()
+
+    # Walk the status changes inside the window on plain epoch seconds
+    first_day = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    changes = [
+        (ts.timestamp(), action == "out_of_order")
+        for ts, action in window
+    ]
+    downtime = _downtime_by_day(
+        changes, current_status == "out_of_order",
+        start_dt.timestamp(), end_dt.timestamp(), first_day.timestamp()
+    )
 
     # Format the calculated data for the response
     daily_stats, total_downtime_sec = [], 0
-    for day, down_sec in sorted(days.items()):
+    for i, down_sec in enumerate(downtime):
+        day = first_day + timedelta(days=i)
         total_downtime_sec += down_sec
         window_start = max(day, start_dt)
         window_end = min(day + timedelta(days=1), end_dt)
@@ -547,21 +667,22 @@ def status_series_api(
     total_window_sec = (end_dt - start_dt).total_seconds()
     total_uptime_sec = max(total_window_sec - total_downtime_sec, 0.0)
 
-    return {
+    # Plain str/float payload: serialize with orjson directly, skipping jsonable_encoder's walk
+    return ORJSONResponse({
         "daily": daily_stats,
         "totals": {
             "uptime_hours": round(total_uptime_sec / 3600.0, 2),
             "downtime_hours": round(total_downtime_sec / 3600.0, 2),
         }
-    }
+    })
 
-@app.get("/game/{game_id}/revenue-series")
+@app.get("/game/{game_id}/revenue-series", response_class=ORJSONResponse)
 def revenue_series_api(
     game_id: int, start: Optional[str] = None, end: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """API endpoint to get raw revenue data points for charts."""
-    game = db.query(models.Game).filter(models.Game.id == game_id).first()
+    game = db.get(models.Game, game_id, options=[joinedload(models.Game.location)])
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
 
@@ -569,26 +690,32 @@ def revenue_series_api(
     end_dt = datetime.fromisoformat(end).astimezone(timezone.utc) if end else now
     start_dt = datetime.fromisoformat(start).astimezone(timezone.utc) if start else end_dt - timedelta(days=30)
 
-    entries = db.query(models.RevenueEntry).filter(
-        models.RevenueEntry.game_id == game_id,
-        models.RevenueEntry.timestamp >= start_dt,
-        models.RevenueEntry.timestamp <= end_dt
-    ).order_by(models.RevenueEntry.timestamp.asc()).all()
-
     token_value = game.location.token_value if game.location else 1.0
-    to_cash = lambda amount, is_token: (amount * token_value) if is_token else amount
+
+    # Plain rows with the cash conversion done in SQL; no RevenueEntry objects are built
+    cash = case(
+        (models.RevenueEntry.is_token, models.RevenueEntry.amount * token_value),
+        else_=models.RevenueEntry.amount
+    )
+    rows = db.execute(
+        select(models.RevenueEntry.timestamp, models.RevenueEntry.amount,
+               models.RevenueEntry.is_token, cash.label("cash"))
+        .where(models.RevenueEntry.game_id == game_id,
+               models.RevenueEntry.timestamp >= start_dt,
+               models.RevenueEntry.timestamp <= end_dt)
+        .order_by(models.RevenueEntry.timestamp.asc())
+    ).all()
 
     series = []
-    for e in entries:
-        ts = e.timestamp.replace(tzinfo=timezone.utc) if not e.timestamp.tzinfo else e.timestamp
+    for ts, amount, is_token, cash_amount in rows:
         series.append({
             "t": ts.isoformat(),
-            "amount": round(to_cash(e.amount, e.is_token), 2),
-            "raw_amount": e.amount,
-            "type": "tokens" if e.is_token else "cash"
+            "amount": round(cash_amount, 2),
+            "raw_amount": amount,
+            "type": "tokens" if is_token else "cash"
         })
 
-    return {"series": series, "start": start_dt.isoformat(), "end": end_dt.isoformat()}
+    return ORJSONResponse({"series": series, "start": start_dt.isoformat(), "end": end_dt.isoformat()})
 
 
 # =============================================================================
@@ -598,106 +725,82 @@ def revenue_series_api(
 # --- Settings: Main Modal & Tab Rendering ---
 
 @app.get("/settings/modal", response_class=HTMLResponse)
-def settings_modal(request: Request, db: Session = Depends(get_db)):
+def settings_modal(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     """Renders the main settings modal which contains various management tabs."""
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-
+    # The shell only shows the selected location's name; take it from the cached list the Locations tab uses
+    location_id = get_selected_location(request)
+    selected_location = next((loc for loc in crud.get_location_choices(db) if loc.id == location_id), None) if location_id else None
     return templates.TemplateResponse("settings_modal.html", {
         "request": request,
-        "locations": db.query(models.Location).all(),
-        "selected_location": crud.get_location_by_id(db, get_selected_location(request)),
-        "users": db.query(models.User).all(),
-        "games": db.query(models.Game).all(),
+        "selected_location": selected_location,
         "user": user
     })
 
 @app.get("/settings/locations", response_class=HTMLResponse)
-def settings_locations(request: Request, db: Session = Depends(get_db)):
+def settings_locations(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     """Renders the 'Locations' tab content for the settings modal."""
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
     return templates.TemplateResponse("settings_locations.html", {
-        "request": request, "user": user, "locations": crud.get_locations(db)
+        "request": request, "user": user, "locations": crud.get_location_choices(db)
     })
 
+def _row_deleted(events: dict) -> Response:
+    # Empty 200 (not 204) so htmx still swaps it over the row the delete button targets
+    return Response(headers={"HX-Trigger": hx_trigger(events)})
+
 @app.get("/settings/games", response_class=HTMLResponse)
-def settings_games(request: Request, db: Session = Depends(get_db)):
+def settings_games(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     """Renders the 'Games' tab content for the settings modal."""
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
     return templates.TemplateResponse("settings_games.html", {
         "request": request, "user": user, "games": crud.get_all_games(db)
     })
 
 @app.get("/settings/categories", response_class=HTMLResponse)
-def settings_categories(request: Request, db: Session = Depends(get_db)):
+def settings_categories(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     """Renders the 'Categories' tab content for the settings modal."""
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
     return templates.TemplateResponse("settings_categories.html", {
         "request": request, "user": user, "categories": crud.get_categories(db)
     })
 
 @app.get("/settings/users", response_class=HTMLResponse)
-def settings_users(request: Request, db: Session = Depends(get_db)):
+def settings_users(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     """Renders the 'Users' tab content for the settings modal."""
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
     return templates.TemplateResponse("settings_users.html", {
         "request": request, "users": crud.get_users(db), "user": user
     })
 
 @app.get("/settings/admin", response_class=HTMLResponse)
-def settings_admin_tab(request: Request, db: Session = Depends(get_db)):
+def settings_admin_tab(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     """Renders the 'Admin Tools' tab content for the settings modal."""
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
     return templates.TemplateResponse("settings_admin.html", {
         "request": request, "user": user,
-        "games": db.query(models.Game).order_by(models.Game.name).all()
+        "games": crud.get_game_choices(db)
     })
 
 # --- Settings: Location Management ---
 
 @app.get("/settings/location/add", response_class=HTMLResponse)
-def add_location_form(request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-    return templates.TemplateResponse("location_add_modal.html", {"request": request})
+def add_location_form(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
+    return static_page("location_add_modal.html")
 
 @app.post("/settings/location/add", response_class=Response)
 def save_new_location(
     name: str = Form(...), rows: int = Form(...), columns: int = Form(...),
     cell_size: int = Form(...), token_value: float = Form(...),
-    db: Session = Depends(get_db), request: Request = None
+    db: Session = Depends(get_db), request: Request = None,
+    user: models.User = Depends(require_admin)
 ):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-
     new_loc = crud.create_location(
         db=db, name=name, rows=rows, columns=columns,
         cell_size=cell_size, token_value=token_value
     )
     trigger = {"location_saved": {"message": f"Location '{new_loc.name}' created"}}
-    return Response(headers={"HX-Trigger": json.dumps(trigger)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(trigger)})
 
 @app.get("/settings/location/{location_id}/edit", response_class=HTMLResponse)
-def edit_location_form(location_id: int, request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+def edit_location_form(location_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     location = crud.get_location_by_id(db, location_id)
     if not location:
-        return HTMLResponse("Location not found", status_code=404)
+        return responses.LOCATION_NOT_FOUND
     return templates.TemplateResponse("location_edit_modal.html", {
         "request": request, "location": location
     })
@@ -706,14 +809,12 @@ def edit_location_form(location_id: int, request: Request, db: Session = Depends
 def save_location_edit(
     location_id: int, name: str = Form(...), rows: int = Form(...),
     columns: int = Form(...), cell_size: int = Form(...),
-    token_value: float = Form(...), request: Request = None, db: Session = Depends(get_db)
+    token_value: float = Form(...), request: Request = None, db: Session = Depends(get_db),
+    user: models.User = Depends(require_admin)
 ):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
     location = crud.get_location_by_id(db, location_id)
     if not location:
-        return HTMLResponse("Location not found", status_code=404)
+        return responses.LOCATION_NOT_FOUND
 
     # **FIX**: Reverted to direct attribute assignment and db.commit()
     location.name = name
@@ -722,175 +823,118 @@ def save_location_edit(
     location.cell_size = cell_size
     location.token_value = token_value
     db.commit()
-    db.refresh(location)
+    crud.invalidate_location_choices()
 
     trigger = {"location_saved": {"message": f"Location '{location.name}' updated"}}
-    return Response(headers={"HX-Trigger": json.dumps(trigger)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(trigger)})
 
 @app.delete("/settings/location/{location_id}/delete", response_class=HTMLResponse)
-def delete_location(location_id: int, request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+def delete_location(location_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     location = crud.get_location_by_id(db, location_id)
     if not location:
-        return HTMLResponse("Location not found", status_code=404)
+        return responses.LOCATION_NOT_FOUND
 
-    # Prevent deletion if games are assigned to this location
-    if location.games:
+    # Prevent deletion if games are assigned to this location (EXISTS probe, no game rows loaded)
+    if crud.location_has_games(db, location_id):
+        # The button targets its own row; send the error to the whole tab instead
         return templates.TemplateResponse("settings_location_delete_error.html", {
             "request": request, "location_name": location.name
-        })
+        }, headers={"HX-Retarget": "#settings-content", "HX-Reswap": "innerHTML"})
 
     location_name = location.name
     crud.delete_location(db, location)
 
-    response = settings_locations(request, db=db)
-    response.headers["HX-Trigger"] = json.dumps({
+    return _row_deleted({
         "settings_saved": {"message": f"Location '{location_name}' deleted"},
         "refresh_grid": True
     })
-    return response
 
 # --- Settings: Game Management ---
 
 @app.get("/settings/games/add", response_class=HTMLResponse)
-def add_game_form(request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+def add_game_form(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     return templates.TemplateResponse("game_add_modal.html", {
         "request": request,
-        "categories": db.query(models.Category).order_by(models.Category.name).all(),
-        "locations": crud.get_locations(db)
+        "categories": crud.get_category_choices(db),
+        "locations": crud.get_location_choices(db)
     })
 
 @app.post("/settings/games/add", response_class=Response)
 def save_new_game(
-    request: Request, name: str = Form(...), category_id: int = Form(...),
-    location_id: Optional[int] = Form(None),
-    x: Optional[int] = Form(None), y: Optional[int] = Form(None),
-    poc_name: Optional[str] = Form(None), poc_email: Optional[str] = Form(None),
-    poc_phone: Optional[str] = Form(None), icon_upload: UploadFile = File(None),
-    db: Session = Depends(get_db)
+    request: Request, form: GameForm = Depends(game_form),
+    icon_upload: UploadFile = File(None), db: Session = Depends(get_db),
+    user: models.User = Depends(require_admin)
 ):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-
     icon_filename = None
     if icon_upload and icon_upload.filename:
-        save_path = Path("app/static/images") / icon_upload.filename
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        with save_path.open("wb") as buffer:
-            shutil.copyfileobj(icon_upload.file, buffer)
-        icon_filename = icon_upload.filename
-
-    new_game = crud.create_game(
-        db=db, name=name, category_id=category_id, location_id=location_id,
-        x=x, y=y, poc_name=poc_name, poc_email=poc_email,
-        poc_phone=poc_phone, icon=icon_filename
-    )
+        icon_filename = _save_upload(icon_upload)
+
+    new_game = crud.create_game(db=db, icon=icon_filename, **form.model_dump())
     trigger = {
         "game_saved": {"message": f"Game '{new_game.name}' has been created."},
         "refresh_grid": True
     }
-    return Response(headers={"HX-Trigger": json.dumps(trigger)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(trigger)})
 
 @app.get("/settings/games/{game_id}/edit", response_class=HTMLResponse)
-def edit_game_modal(request: Request, game_id: int, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-    game = db.query(models.Game).filter_by(id=game_id).first()
+def edit_game_modal(request: Request, game_id: int, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
+    game = crud.get_game_by_id(db, game_id)
     if not game:
-        return HTMLResponse("Game not found", status_code=404)
+        return responses.GAME_NOT_FOUND
 
     return templates.TemplateResponse("game_edit_modal.html", {
         "request": request, "user": user, "game": game,
-        "categories": db.query(models.Category).order_by(models.Category.name).all(),
-        "locations": crud.get_locations(db)
+        "categories": crud.get_category_choices(db),
+        "locations": crud.get_location_choices(db)
     })
 
 @app.post("/settings/games/{game_id}/edit", response_class=Response)
 def save_game_changes(
-    request: Request, game_id: int, name: str = Form(...),
-    category_id: int = Form(...), location_id: Optional[int] = Form(None),
-    x: Optional[int] = Form(None), y: Optional[int] = Form(None),
-    poc_name: Optional[str] = Form(None), poc_email: Optional[str] = Form(None),
-    poc_phone: Optional[str] = Form(None), icon_upload: UploadFile = File(None),
-    db: Session = Depends(get_db)
+    request: Request, game_id: int, form: GameForm = Depends(game_form),
+    icon_upload: UploadFile = File(None), db: Session = Depends(get_db),
+    user: models.User = Depends(require_admin)
 ):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-    game = db.query(models.Game).filter_by(id=game_id).first()
-    if not game:
-        return HTMLResponse("Game not found", status_code=404)
-
-    # **FIX**: Reverted to direct attribute assignment and db.commit()
+    values = form.model_dump()
+    # Without a new upload the stored icon is left as it is
     if icon_upload and icon_upload.filename:
-        save_path = Path("app/static/images") / icon_upload.filename
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        with save_path.open("wb") as buffer:
-            shutil.copyfileobj(icon_upload.file, buffer)
-        game.icon = icon_upload.filename
-
-    game.name = name
-    game.category_id = category_id
-    game.location_id = location_id
-    game.x = x
-    game.y = y
-    game.poc_name = poc_name or None
-    game.poc_email = poc_email or None
-    game.poc_phone = poc_phone or None
-    db.commit()
+        values["icon"] = _save_upload(icon_upload)
+
+    if not crud.update_game(db, game_id, **values):
+        return responses.GAME_NOT_FOUND
 
     trigger = {
-        "game_saved": {"message": f"Game '{game.name}' updated."},
+        "game_saved": {"message": f"Game '{form.name}' updated."},
         "refresh_grid": True
     }
-    return Response(headers={"HX-Trigger": json.dumps(trigger)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(trigger)})
 
 @app.delete("/settings/games/{game_id}/delete", response_class=HTMLResponse)
-def delete_game(game_id: int, request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+def delete_game(game_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     game = crud.get_game_by_id(db, game_id)
     if not game:
-        return HTMLResponse("Game not found", status_code=404)
+        return responses.GAME_NOT_FOUND
 
     name = game.name
-    # Assuming crud.delete_game handles deleting dependent logs/revenue
     crud.delete_game(db, game)
 
-    resp = settings_games(request, db=db)
-    resp.headers["HX-Trigger"] = json.dumps({
+    return _row_deleted({
         "settings_saved": {"message": f"Game '{name}' deleted."},
         "refresh_grid": True
     })
-    return resp
 
 # --- Settings: Category Management ---
 
 @app.get("/settings/category/add", response_class=HTMLResponse)
-def add_category_form(request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-    return templates.TemplateResponse("category_add_modal.html", {"request": request})
+def add_category_form(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
+    return static_page("category_add_modal.html")
 
 @app.post("/settings/category/add", response_class=Response)
 def save_new_category(
     request: Request, name: str = Form(...), icon_upload: UploadFile = File(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    user: models.User = Depends(require_admin)
 ):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-
-    if crud.get_category_by_name(db, name.strip()):
+    if crud.category_name_exists(db, name.strip()):
         return templates.TemplateResponse("category_add_modal.html", {
             "request": request, "error": f"A category named '{name}' already exists.",
             "name": name
@@ -898,24 +942,17 @@ def save_new_category(
 
     icon_filename = None
     if icon_upload and icon_upload.filename:
-        save_path = Path("app/static/images") / icon_upload.filename
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        with save_path.open("wb") as buffer:
-            shutil.copyfileobj(icon_upload.file, buffer)
-        icon_filename = icon_upload.filename
+        icon_filename = _save_upload(icon_upload)
 
     new_cat = crud.create_category(db, name=name, icon=icon_filename)
     trigger = {"category_saved": {"message": f"Category '{new_cat.name}' created."}}
-    return Response(headers={"HX-Trigger": json.dumps(trigger)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(trigger)})
 
 @app.get("/settings/category/{category_id}/edit", response_class=HTMLResponse)
-def edit_category_form(category_id: int, request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+def edit_category_form(category_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     category = crud.get_category_by_id(db, category_id)
     if not category:
-        return HTMLResponse("Category not found", status_code=404)
+        return responses.CATEGORY_NOT_FOUND
     return templates.TemplateResponse("category_edit_modal.html", {
         "request": request, "category": category
     })
@@ -923,100 +960,79 @@ def edit_category_form(category_id: int, request: Request, db: Session = Depends
 @app.post("/settings/category/{category_id}/edit", response_class=Response)
 def save_category_changes(
     category_id: int, request: Request, name: str = Form(...),
-    icon_upload: UploadFile = File(None), db: Session = Depends(get_db)
+    icon_upload: UploadFile = File(None), db: Session = Depends(get_db),
+    user: models.User = Depends(require_admin)
 ):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
     category = crud.get_category_by_id(db, category_id)
     if not category:
-        return HTMLResponse("Category not found", status_code=404)
+        return responses.CATEGORY_NOT_FOUND
 
-    existing = crud.get_category_by_name(db, name.strip())
-    if existing and existing.id != category.id:
+    if crud.category_name_exists(db, name.strip(), exclude_id=category.id):
         return templates.TemplateResponse("category_edit_modal.html", {
             "request": request, "category": category,
             "error": f"A category named '{name}' already exists."
         })
 
     if icon_upload and icon_upload.filename:
-        save_path = Path("app/static/images") / icon_upload.filename
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        with save_path.open("wb") as buffer:
-            shutil.copyfileobj(icon_upload.file, buffer)
-        category.icon = icon_upload.filename
+        category.icon = _save_upload(icon_upload)
 
     category.name = name.strip()
     db.commit()
-    db.refresh(category)
+    crud.invalidate_category_choices()
 
     trigger = {"category_saved": {"message": f"Category '{category.name}' updated."}}
-    return Response(headers={"HX-Trigger": json.dumps(trigger)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(trigger)})
 
 @app.delete("/settings/category/{category_id}/delete", response_class=HTMLResponse)
-def delete_category(category_id: int, request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+def delete_category(category_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     category = crud.get_category_by_id(db, category_id)
     if not category:
-        return HTMLResponse("Category not found", status_code=404)
-    if category.games:
-        return HTMLResponse("Cannot delete: category is in use by games.", status_code=400)
+        return responses.CATEGORY_NOT_FOUND
+    if crud.category_has_games(db, category_id):
+        return responses.CATEGORY_IN_USE
 
     name = category.name
     crud.delete_category(db, category)
 
-    response = settings_categories(request, db=db)
-    response.headers["HX-Trigger"] = json.dumps({
+    return _row_deleted({
         "settings_saved": {"message": f"Category '{name}' deleted."}
     })
-    return response
 
 # --- Settings: User Management ---
 
 @app.get("/settings/user/add", response_class=HTMLResponse)
-def add_user_form(request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-    return templates.TemplateResponse("user_add_modal.html", {
-        "request": request, "roles": models.UserRole
-    })
+def add_user_form(request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
+    return static_page("user_add_modal.html", roles=models.UserRole)
 
 @app.post("/settings/user/add", response_class=Response)
 def save_new_user(
     request: Request, name: str = Form(...), pin: str = Form(...),
     role: models.UserRole = Form(...), email: Optional[str] = Form(None),
     phone: Optional[str] = Form(None), notify: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    user: models.User = Depends(require_admin)
 ):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-
-    if crud.get_user_by_pin(db, pin):
+    # users.pin is unique, so a taken PIN fails the INSERT itself; no lookup first
+    try:
+        new_user = crud.create_user(
+            db, name=name, pin=pin, role=role, email=email,
+            phone=phone, notify=bool(notify)
+        )
+    except IntegrityError:
+        db.rollback()
         return templates.TemplateResponse("_user_add_form.html", {
             "request": request, "roles": models.UserRole, "name": name,
             "role": role.value, "email": email or "", "phone": phone or "",
             "notify": bool(notify), "error": f"PIN '{pin}' is already taken."
         })
-
-    new_user = crud.create_user(
-        db, name=name, pin=pin, role=role, email=email,
-        phone=phone, notify=bool(notify)
-    )
     trigger = {"user_saved": {"message": f"User '{new_user.name}' has been created."}}
-    return Response(headers={"HX-Trigger": json.dumps(trigger)})
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(trigger)})
 
 @app.get("/settings/user/{user_id}/edit", response_class=HTMLResponse)
-def edit_user_form(user_id: int, request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+def edit_user_form(user_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     user_to_edit = crud.get_user_by_id(db, user_id)
     if not user_to_edit:
-        return HTMLResponse("User not found", status_code=404)
+        return responses.USER_NOT_FOUND
     return templates.TemplateResponse("user_edit_modal.html", {
         "request": request, "user_to_edit": user_to_edit, "roles": models.UserRole
     })
@@ -1026,71 +1042,64 @@ def save_user_changes(
     user_id: int, request: Request, name: str = Form(...),
     pin: Optional[str] = Form(None), role: models.UserRole = Form(...),
     email: Optional[str] = Form(None), phone: Optional[str] = Form(None),
-    notify: Optional[str] = Form(None), db: Session = Depends(get_db)
+    notify: Optional[str] = Form(None), db: Session = Depends(get_db),
+    user: models.User = Depends(require_admin)
 ):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-    user_to_edit = crud.get_user_by_id(db, user_id)
-    if not user_to_edit:
-        return HTMLResponse("User not found", status_code=404)
+    try:
+        updated = crud.update_user(
+            db, user_id=user_id, name=name, pin=pin, role=role,
+            email=email, phone=phone, notify=bool(notify)
+        )
+    except IntegrityError:
+        db.rollback()
+        user_to_edit = crud.get_user_by_id(db, user_id)
+        if not user_to_edit:
+            return responses.USER_NOT_FOUND
+        # Re-show what was submitted; nothing is committed, so these edits are discarded with the session
+        user_to_edit.name, user_to_edit.email, user_to_edit.phone = name, email, phone
+        user_to_edit.role, user_to_edit.notify = role, bool(notify)
+        return templates.TemplateResponse("user_edit_modal.html", {
+            "request": request, "user_to_edit": user_to_edit, "roles": models.UserRole,
+            "error": f"PIN '{pin}' is already taken."
+        })
+    if not updated:
+        return responses.USER_NOT_FOUND
 
-    updated_user = crud.update_user(
-        db, user=user_to_edit, name=name, pin=pin, role=role,
-        email=email, phone=phone, notify=bool(notify)
-    )
-    trigger = {"user_saved": {"message": f"User '{updated_user.name}' has been updated."}}
-    return Response(headers={"HX-Trigger": json.dumps(trigger)})
+    trigger = {"user_saved": {"message": f"User '{name}' has been updated."}}
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger(trigger)})
 
 @app.delete("/settings/user/{user_id}/delete", response_class=HTMLResponse)
-def delete_user(user_id: int, request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+def delete_user(user_id: int, request: Request, db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
     if user.id == user_id:
-        return HTMLResponse("You cannot delete your own account.", status_code=400)
+        return responses.CANNOT_DELETE_SELF
 
     user_to_delete = crud.get_user_by_id(db, user_id)
     if not user_to_delete:
-        return HTMLResponse("User not found.", status_code=404)
+        return responses.USER_NOT_FOUND
 
     user_name = user_to_delete.name
     crud.delete_user(db, user_to_delete)
 
-    response = settings_users(request, db=db)
-    response.headers["HX-Trigger"] = json.dumps({
+    return _row_deleted({
         "settings_saved": {"message": f"User '{user_name}' has been deleted."}
     })
-    return response
 
 # --- Settings: Admin Tools ---
 
-@app.post("/settings/clear-status-history", response_class=HTMLResponse)
-def clear_status_history(request: Request, game_id: int = Form(...), db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
-
-    db.query(models.LogEntry).filter(models.LogEntry.game_id == game_id).delete()
-    db.commit()
+@app.post("/settings/clear-status-history")
+def clear_status_history(request: Request, game_id: int = Form(...), db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
+    crud.clear_status_history_for_game(db, game_id)
 
-    resp = settings_admin_tab(request, db)
-    resp.headers["HX-Trigger"] = json.dumps({
+    # The game list is unchanged, so the tab stays as it is and only the toast fires
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger({
         "settings_saved": {"message": "Status history cleared for the selected game."}
-    })
-    return resp
+    })})
 
-@app.post("/settings/clear-revenue-history", response_class=HTMLResponse)
-def clear_revenue_history(request: Request, game_id: int = Form(...), db: Session = Depends(get_db)):
-    user = get_current_user(request, db)
-    if not user or user.role != models.UserRole.admin:
-        return HTMLResponse("Unauthorized", status_code=403)
+@app.post("/settings/clear-revenue-history")
+def clear_revenue_history(request: Request, game_id: int = Form(...), db: Session = Depends(get_db), user: models.User = Depends(require_admin)):
+    crud.clear_revenue_history_for_game(db, game_id)
 
-    db.query(models.RevenueEntry).filter(models.RevenueEntry.game_id == game_id).delete()
-    db.commit()
-
-    resp = settings_admin_tab(request, db)
-    resp.headers["HX-Trigger"] = json.dumps({
+    # The game list is unchanged, so the tab stays as it is and only the toast fires
+    return Response(status_code=204, headers={"HX-Trigger": hx_trigger({
         "settings_saved": {"message": "Revenue history cleared for the selected game."}
-    })
-    return resp
\ No newline at end of file
+    })})
\ No newline at end of file
@@ -0,0 +1,87 @@
+# app/middleware.py
+import json
+import logging
+import time
+from base64 import b64decode, b64encode
+
+from itsdangerous.exc import BadSignature
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.database import count_queries
+
+log = logging.getLogger(__name__)
+
+
+class SessionASGIMiddleware(SessionMiddleware):
+	"""Signed-cookie sessions (same cookie format) that only re-send the cookie when it changed or is getting old."""
+
+	def __init__(self, app, secret_key, refresh_after: int = 24 * 60 * 60, **kwargs):
+		super().__init__(app, secret_key, **kwargs)
+		self.refresh_after = refresh_after
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] not in ("http", "websocket"):
+			await self.app(scope, receive, send)
+			return
+
+		connection = HTTPConnection(scope)
+		payload = None
+		signed_at = None
+
+		if self.session_cookie in connection.cookies:
+			try:
+				payload, signed_at = self.signer.unsign(
+					connection.cookies[self.session_cookie].encode("utf-8"),
+					max_age=self.max_age, return_timestamp=True,
+				)
+				scope["session"] = json.loads(b64decode(payload))
+			except BadSignature:
+				payload = None
+				scope["session"] = {}
+		else:
+			scope["session"] = {}
+
+		async def send_wrapper(message: Message) -> None:
+			if message["type"] == "http.response.start":
+				if scope["session"]:
+					data = b64encode(json.dumps(scope["session"]).encode("utf-8"))
+					# Unchanged and recently signed: the browser's cookie is still good
+					stale = signed_at is None or time.time() - signed_at.timestamp() > self.refresh_after
+					if data != payload or stale:
+						headers = MutableHeaders(scope=message)
+						headers.append("Set-Cookie", "{session_cookie}={data}; path={path}; {max_age}{security_flags}".format(
+							session_cookie=self.session_cookie,
+							data=self.signer.sign(data).decode("utf-8"),
+							path=self.path,
+							max_age=f"Max-Age={self.max_age}; " if self.max_age else "",
+							security_flags=self.security_flags,
+						))
+				elif payload is not None:
+					# The session has been cleared
+					headers = MutableHeaders(scope=message)
+					headers.append("Set-Cookie", "{session_cookie}=null; path={path}; expires=Thu, 01 Jan 1970 00:00:00 GMT; {security_flags}".format(
+						session_cookie=self.session_cookie,
+						path=self.path,
+						security_flags=self.security_flags,
+					))
+			await send(message)
+
+		await self.app(scope, receive, send_wrapper)
+
+
+class QueryCountMiddleware:
+	"""Dev aid: logs how many SQL statements each request issued. Counts overlap under concurrent requests."""
+
+	def __init__(self, app: ASGIApp):
+		self.app = app
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+		with count_queries() as statements:
+			await self.app(scope, receive, send)
+		log.warning("%s %s: %d queries", scope["method"], scope["path"], len(statements))
@@ -1,10 +1,27 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Float, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Float, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 from app.database import Base  # 🔽 absolute
+from datetime import timezone
 import enum
 
+class UTCDateTime(TypeDecorator):
+	"""DateTime stored as UTC and always returned timezone-aware (SQLite drops the offset)."""
+	impl = DateTime(timezone=True)
+	cache_ok = True
+
+	def process_bind_param(self, value, dialect):
+		if value is not None and value.tzinfo is not None:
+			value = value.astimezone(timezone.utc)
+		return value
+
+	def process_result_value(self, value, dialect):
+		if value is not None and value.tzinfo is None:
+			value = value.replace(tzinfo=timezone.utc)
+		return value
+
 class UserRole(str, enum.Enum):
 	admin = "admin"
 	user = "user"
@@ -29,7 +46,7 @@ class User(Base):
 
 	id = Column(Integer, primary_key=True, index=True)
 	name = Column(String, nullable=False)
-	pin = Column(String(4), nullable=False)
+	pin = Column(String(4), nullable=False, unique=True, index=True)
 	role = Column(Enum(UserRole), default=UserRole.user)
 	email = Column(String, nullable=True)
 	phone = Column(String, nullable=True)
@@ -64,6 +81,8 @@ class Category(Base):
 
 class Game(Base):
 	__tablename__ = "games"
+	# Grid moves look up the game occupying a cell
+	__table_args__ = (Index("ix_games_location_id_x_y", "location_id", "x", "y"),)
 
 	id = Column(Integer, primary_key=True, index=True)
 	name = Column(String, nullable=False)
@@ -87,13 +106,15 @@ class Game(Base):
 
 class LogEntry(Base):
 	__tablename__ = "log_entries"
+	# History and series queries filter by game and order by time
+	__table_args__ = (Index("ix_log_entries_game_id_timestamp", "game_id", "timestamp"),)
 
 	id = Column(Integer, primary_key=True, index=True)
-	timestamp = Column(DateTime(timezone=True), server_default=func.now())
+	timestamp = Column(UTCDateTime, server_default=func.now())
 	action = Column(String)
 	comments = Column(String, nullable=True)
 
-	user_id = Column(Integer, ForeignKey("users.id"))
+	user_id = Column(Integer, ForeignKey("users.id"), index=True)
 	game_id = Column(Integer, ForeignKey("games.id"))
 
 	user = relationship("User", back_populates="logs")
@@ -101,13 +122,14 @@ class LogEntry(Base):
 
 class RevenueEntry(Base):
 	__tablename__ = "revenue_entries"
+	__table_args__ = (Index("ix_revenue_entries_game_id_timestamp", "game_id", "timestamp"),)
 
 	id = Column(Integer, primary_key=True, index=True)
-	timestamp = Column(DateTime(timezone=True), server_default=func.now())
+	timestamp = Column(UTCDateTime, server_default=func.now())
 	amount = Column(Float, nullable=False)
 	is_token = Column(Boolean, default=False)
 
-	user_id = Column(Integer, ForeignKey("users.id"))
+	user_id = Column(Integer, ForeignKey("users.id"), index=True)
 	game_id = Column(Integer, ForeignKey("games.id"))
 
 	user = relationship("User", back_populates="revenue_entries")
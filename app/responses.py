@@ -0,0 +1,15 @@
+# app/responses.py
+from fastapi.responses import HTMLResponse, Response
+
+# Constant bodies are encoded once at import and the same Response is returned each time
+NOT_LOGGED_IN = HTMLResponse("Unauthorized", status_code=401)
+GAME_NOT_FOUND = HTMLResponse("Game not found", status_code=404)
+LOCATION_NOT_FOUND = HTMLResponse("Location not found", status_code=404)
+CATEGORY_NOT_FOUND = HTMLResponse("Category not found", status_code=404)
+USER_NOT_FOUND = HTMLResponse("User not found", status_code=404)
+ALREADY_INITIALIZED = HTMLResponse("Already initialized", status_code=400)
+CATEGORY_IN_USE = HTMLResponse("Cannot delete: category is in use by games.", status_code=400)
+CANNOT_DELETE_SELF = HTMLResponse("You cannot delete your own account.", status_code=400)
+
+# Trigger-only reply that just closes the open modal
+CLOSE_MODAL = Response(status_code=204, headers={"HX-Trigger": '{"close_modal":true}'})
@@ -1,98 +1,71 @@
 # app/seed.py
+from sqlalchemy import insert, or_, select
+
 from app.database import SessionLocal
 from app import models
 
 def run():
-    db = SessionLocal()
-
-    location = db.query(models.Location).filter_by(name="Main Arcade").first()
-    if not location:
-        location = models.Location(
-            name="Main Arcade",
-            rows=5,
-            columns=5,
-            cell_size=80,
-            token_value=1.0,
-            background_image=None
-        )
-        db.add(location)
-    else:
+    # One transaction for the whole seed; new rows are grouped per model and
+    # sent as a single executemany INSERT instead of one statement per object.
+    with SessionLocal() as db, db.begin():
+        location = db.query(models.Location).filter_by(name="Main Arcade").first()
+        if not location:
+            location = models.Location(name="Main Arcade", background_image=None)
+            db.add(location)
         location.rows = 5
         location.columns = 5
         location.cell_size = 80
         location.token_value = 1.0
-    db.flush()
-
-
-    # --- Categories ---
-    arcade_cat = db.query(models.Category).filter_by(name="Arcade").first()
-    if not arcade_cat:
-        arcade_cat = models.Category(name="Arcade")
-        db.add(arcade_cat)
         db.flush()
 
-    pinball_cat = db.query(models.Category).filter_by(name="Pinball").first()
-    if not pinball_cat:
-        pinball_cat = models.Category(name="Pinball")
-        db.add(pinball_cat)
-        db.flush()
-
-    # --- Games ---
-    sf2 = db.query(models.Game).filter_by(name="Street Fighter II").first()
-    if not sf2:
-        sf2 = models.Game(
-            name="Street Fighter II",
-            category_id=arcade_cat.id,
-            location_id=location.id,
-            x=2,
-            y=2,
-            status=models.GameStatus.working
-        )
-        db.add(sf2)
-
-    indiana = db.query(models.Game).filter_by(name="Indiana Jones").first()
-    if not indiana:
-        indiana = models.Game(
-            name="Indiana Jones",
-            category_id=pinball_cat.id,
-            location_id=location.id,
-            x=4,
-            y=3,
-            status=models.GameStatus.working
-        )
-        db.add(indiana)
+        # --- Categories ---
+        category_names = ("Arcade", "Pinball")
+        categories = {c.name: c for c in db.query(models.Category).filter(models.Category.name.in_(category_names))}
+        new_categories = [{"name": name} for name in category_names if name not in categories]
+        if new_categories:
+            db.execute(insert(models.Category), new_categories)
+            categories = {c.name: c for c in db.query(models.Category).filter(models.Category.name.in_(category_names))}
 
-    # --- Users ---
-    boss = db.query(models.User).filter_by(name="Boss").first()
-    if not boss:
-        boss = models.User(
-            name="Boss",
-            pin="1111",
-            role=models.UserRole.admin,
-            email="boss@example.com"
-        )
-        db.add(boss)
-    else:
-        boss.pin = "1111"
-        boss.role = models.UserRole.admin
-        boss.email = "boss@example.com"
+        # --- Games ---
+        games = [
+            {"name": "Street Fighter II", "category_id": categories["Arcade"].id, "x": 2, "y": 2},
+            {"name": "Indiana Jones", "category_id": categories["Pinball"].id, "x": 4, "y": 3},
+        ]
+        existing_games = set(db.scalars(
+            select(models.Game.name).where(models.Game.name.in_([g["name"] for g in games]))
+        ))
+        new_games = [
+            dict(g, location_id=location.id, status=models.GameStatus.working)
+            for g in games
+            if g["name"] not in existing_games
+        ]
+        if new_games:
+            db.execute(insert(models.Game), new_games)
 
-    employee = db.query(models.User).filter_by(name="Employee").first()
-    if not employee:
-        employee = models.User(
-            name="Employee",
-            pin="2222",
-            role=models.UserRole.user,
-            email="employee@example.com"
-        )
-        db.add(employee)
-    else:
-        employee.pin = "2222"
-        employee.role = models.UserRole.user
-        employee.email = "employee@example.com"
+        # --- Users ---
+        users = [
+            {"name": "Boss", "pin": "1111", "role": models.UserRole.admin, "email": "boss@example.com"},
+            {"name": "Employee", "pin": "2222", "role": models.UserRole.user, "email": "employee@example.com"},
+        ]
+        # PINs are unique, so a renamed seed user is still found by its PIN
+        matches = db.query(models.User).filter(or_(
+            models.User.name.in_([u["name"] for u in users]),
+            models.User.pin.in_([u["pin"] for u in users]),
+        )).all()
+        by_name = {m.name: m for m in matches}
+        by_pin = {m.pin: m for m in matches}
+        new_users = []
+        for u in users:
+            existing = by_name.get(u["name"]) or by_pin.get(u["pin"])
+            if not existing:
+                new_users.append(u)
+            else:
+                existing.pin = u["pin"]
+                existing.role = u["role"]
+                existing.email = u["email"]
+        if new_users:
+            db.execute(insert(models.User), new_users)
 
-    db.commit()
-    db.close()
     print("✅ Seed complete: ensured settings, location, categories, games, and users are correct")
 
 if __name__ == "__main__":